@@ -1,14 +1,29 @@
 # Databricks notebook source
 import time
+import threading
 import json
 import math
 import typing as T
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
+from urllib.parse import urlparse
 
 import requests
+from delta.tables import DeltaTable
+from requests.adapters import HTTPAdapter
 from pyspark.sql import functions as F
 from pyspark.sql import types as Tz
 
+try:
+    from requests_cache import CachedSession
+except ImportError:  # optional: %pip install requests-cache to enable the HTTP response cache
+    CachedSession = None
+
+try:
+    import orjson
+except ImportError:  # optional: %pip install orjson for faster JSON decode/encode
+    orjson = None
+
 # COMMAND ----------
 
 # ===========================================
@@ -31,6 +46,16 @@ dbutils.widgets.text("schema", "hubspot_bronze")
 # Watermark storage (Delta table path)
 dbutils.widgets.text("watermark_path", "dbfs:/mnt/datalake/_control/hubspot_watermarks")
 
+# Per-entity bronze schemas inferred on first ingest (delete an entity's file to re-infer)
+dbutils.widgets.text("schema_cache_path", "dbfs:/mnt/datalake/_control/hubspot_schemas")
+
+# Optional HTTP response cache for slow-changing GET endpoints (opt-in, blank = disabled).
+# Each cached endpoint is called once per run, so it only helps reruns within the expiry window,
+# and a hit re-writes that (possibly stale) reference data under the new run's _ingested_at.
+# Use a local-disk sqlite path such as /local_disk0/tmp/hubspot_cache; SQLite does not work on
+# /dbfs (the FUSE mount lacks random writes and file locking).
+dbutils.widgets.text("http_cache_path", "")
+
 
 SECRET_SCOPE = dbutils.widgets.get("secret_scope")
 CLIENT_ID_KEY = dbutils.widgets.get("client_id_key")
@@ -43,29 +68,165 @@ BRONZE_BASE_PATH = dbutils.widgets.get("bronze_base_path").rstrip("/")
 CATALOG = dbutils.widgets.get("catalog").strip()
 SCHEMA = dbutils.widgets.get("schema").strip()
 WATERMARK_PATH = dbutils.widgets.get("watermark_path").rstrip("/")
+SCHEMA_CACHE_PATH = dbutils.widgets.get("schema_cache_path").rstrip("/")
+HTTP_CACHE_PATH = dbutils.widgets.get("http_cache_path").strip()
+
+# One ingestion timestamp per notebook run, stamped on every bronze row written by it
+RUN_TS = datetime.now(timezone.utc).isoformat()
+
+
+
+# Shared HTTP session: keep-alive connections to the HubSpot API are reused across calls
+HTTP_POOL_SIZE = 32
+
+# GET endpoints that change far less often than the load cadence; only these are cached.
+# Token refreshes and search/batch POSTs are never cached.
+CACHEABLE_GET_PATHS = (
+    "/settings/v3/currencies",
+    "/cms/v3/domains",
+    "/crm/v3/taxes/tax-rates",
+    "/communication-preferences/v4/definitions",
+    "/crm/v3/owners",
+)
+HTTP_CACHE_EXPIRE_S = 3600
+
+if CachedSession is not None and HTTP_CACHE_PATH:
+    _SESSION = CachedSession(
+        cache_name=HTTP_CACHE_PATH,
+        backend="sqlite",
+        expire_after=HTTP_CACHE_EXPIRE_S,
+        cache_control=True,  # honour Cache-Control and revalidate with ETag/Last-Modified
+        allowable_methods=("GET",),
+        filter_fn=lambda resp: urlparse(resp.url).path.startswith(CACHEABLE_GET_PATHS),
+    )
+else:
+    _SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=0))
+
+
+
+def _json_loads(data: bytes) -> T.Any:
+    return orjson.loads(data) if orjson else json.loads(data)
+
+def _json_dumps(obj: T.Any) -> str:
+    return orjson.dumps(obj).decode() if orjson else json.dumps(obj)
 
 
 
 def _secret(key: str) -> str:
     return dbutils.secrets.get(scope=SECRET_SCOPE, key=key)
 
-def get_access_token() -> str:
+# OAuth client credentials don't change mid-run: read them from the secret scope once
+_CLIENT_ID = _secret(CLIENT_ID_KEY)
+_CLIENT_SECRET = _secret(CLIENT_SECRET_KEY)
+_REFRESH_TOKEN = _secret(REFRESH_TOKEN_KEY)
+TOKEN_URL = f"{BASE_URL}/oauth/v1/token"
+
+# Cached OAuth access token (refreshed shortly before expiry, see _ensure_token)
+_TOKEN: str | None = None
+_TOKEN_EXP: float = 0.0
+_TOKEN_LOCK = threading.Lock()
+TOKEN_REFRESH_SKEW_S = 60
+
+def get_access_token() -> tuple[str, float]:
     """
     Refresh HubSpot OAuth access token using refresh_token grant.
+    Returns (access_token, expires_at) with expires_at on the time.monotonic() clock.
     Docs: POST /oauth/v1/token.  [2](https://developers.hubspot.com/docs/api-reference/auth-oauth-v1/tokens/post-oauth-v1-token)
     """
-    url = f"{BASE_URL}/oauth/v1/token"
     payload = {
         "grant_type": "refresh_token",
-        "client_id": _secret(CLIENT_ID_KEY),
-        "client_secret": _secret(CLIENT_SECRET_KEY),
-        "refresh_token": _secret(REFRESH_TOKEN_KEY),
+        "client_id": _CLIENT_ID,
+        "client_secret": _CLIENT_SECRET,
+        "refresh_token": _REFRESH_TOKEN,
     }
     headers = {"Content-Type": "application/x-www-form-urlencoded"}
-    resp = requests.post(url, data=payload, headers=headers, timeout=60)
+    requested_at = time.monotonic()
+    resp = _SESSION.post(TOKEN_URL, data=payload, headers=headers, timeout=60)
     if resp.status_code >= 300:
         raise RuntimeError(f"Token refresh failed: {resp.status_code} {resp.text}")
-    return resp.json()["access_token"]
+    data = _json_loads(resp.content)
+    return data["access_token"], requested_at + float(data.get("expires_in", 1800))
+
+def _ensure_token(stale: str | None = None) -> str:
+    """
+    Return the cached access token, refreshing it when close to expiry or when it is still
+    the `stale` token a caller just got a 401 with (so concurrent 401s refresh only once).
+    """
+    global _TOKEN, _TOKEN_EXP
+    with _TOKEN_LOCK:
+        if (
+            _TOKEN is None
+            or (stale is not None and _TOKEN == stale)
+            or time.monotonic() >= _TOKEN_EXP - TOKEN_REFRESH_SKEW_S
+        ):
+            _TOKEN, _TOKEN_EXP = get_access_token()
+        return _TOKEN
+
+
+
+class RateLimiter:
+    """
+    Thread-safe request pacing for the HubSpot API.
+    Spaces calls to at most max_per_second and, using the X-HubSpot-RateLimit-* response
+    headers, holds callers until the window resets once the remaining budget runs low.
+    """
+
+    def __init__(self, max_per_second: float = 9.0, threshold: int = 2):
+        self.min_interval_s = 1.0 / max_per_second
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+        self._remaining: int | None = None
+        self._interval_s = 10.0  # HubSpot's burst window until the headers say otherwise
+        self._window_reset = 0.0
+
+    def acquire(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_slot)
+            if self._remaining is not None and self._remaining < self.threshold:
+                start = max(start, self._window_reset)
+                self._remaining = None  # budget refills once the window has passed
+            elif self._remaining is not None:
+                self._remaining -= 1
+                if self._remaining < self.threshold:
+                    # Budget spent locally: the next caller waits a full window from here
+                    self._window_reset = max(self._window_reset, start + self._interval_s)
+            self._next_slot = start + self.min_interval_s
+        delay = start - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def update(self, headers: T.Mapping[str, str]) -> None:
+        remaining = headers.get("X-HubSpot-RateLimit-Remaining")
+        if remaining is None or not remaining.isdigit():
+            return
+        interval_ms = headers.get("X-HubSpot-RateLimit-Interval-Milliseconds")
+        with self._lock:
+            if interval_ms and interval_ms.isdigit():
+                self._interval_s = int(interval_ms) / 1000
+            now = time.monotonic()
+            if now < self._window_reset:
+                # Inside a drained/exhausted window: responses that were in flight before the
+                # 429 (or before the budget ran out) must not raise the budget or move the reset.
+                if self._remaining is not None:
+                    self._remaining = min(int(remaining), self._remaining)
+                return
+            self._remaining = int(remaining)
+            if self._remaining < self.threshold:
+                self._window_reset = now + self._interval_s
+
+    def drain(self, wait_s: float) -> None:
+        """
+        Empty the budget after a 429 so every caller waits out Retry-After.
+        """
+        with self._lock:
+            self._remaining = 0
+            self._window_reset = max(self._window_reset, time.monotonic() + wait_s)
+
+# 9 req/s leaves headroom under HubSpot's 10 req/s per-app burst limit
+RATE_LIMITER = RateLimiter(max_per_second=9.0)
 
 
 
@@ -79,80 +240,299 @@ def hs_request(
 ) -> dict:
     """
     HubSpot API request wrapper with basic retry/backoff.
+    Reuses the cached access token; a 401 forces one token refresh and retry.
     """
-    token = get_access_token()
     url = f"{BASE_URL}{path}"
-    headers = {"Authorization": f"Bearer {token}"}
+    refreshed = False
 
     attempt = 0
     while True:
         attempt += 1
-        resp = requests.request(
+        token = _ensure_token()
+        RATE_LIMITER.acquire()
+        resp = _SESSION.request(
             method=method.upper(),
             url=url,
-            headers=headers,
+            headers={"Authorization": f"Bearer {token}"},  # pin the token this attempt used
             params=params,
             json=json_body,
             timeout=timeout_s
         )
+        RATE_LIMITER.update(resp.headers)
         if resp.status_code < 300:
-            return resp.json() if resp.text else {}
+            return _json_loads(resp.content) if resp.content else {}
+
+        # Token revoked/expired early: refresh once and retry
+        if resp.status_code == 401 and not refreshed:
+            refreshed = True
+            _ensure_token(stale=token)
+            continue
 
         # Retry on transient conditions
         if resp.status_code in (429, 500, 502, 503, 504) and attempt <= max_retries:
-            retry_after = resp.headers.get("Retry-After")
-            sleep_s = int(retry_after) if retry_after and retry_after.isdigit() else int(min(60, 2 ** attempt))
-            time.sleep(sleep_s)
+            try:
+                sleep_s = float(resp.headers.get("Retry-After"))
+            except (TypeError, ValueError):
+                sleep_s = float(min(60, 2 ** attempt))
+            if resp.status_code == 429:
+                RATE_LIMITER.drain(sleep_s)  # next acquire() waits for the window
+            else:
+                time.sleep(sleep_s)
             continue
 
         raise RuntimeError(f"HubSpot API error {resp.status_code} for {path}: {resp.text}")
 
 
 
-def paginate_get(path: str, params: dict | None = None, page_key: str = "results") -> list[dict]:
+# Bounded fan-out for independent HubSpot calls (stays under the per-app rate limit)
+HTTP_CONCURRENCY = 10
+
+def map_concurrent(fn: T.Callable, items: T.Iterable, max_workers: int = HTTP_CONCURRENCY) -> list:
+    """
+    Apply fn to each item on a bounded thread pool, preserving input order.
+    Requests are I/O-bound, so threads sharing _SESSION overlap the network waits.
+    """
+    items = list(items)
+    if not items:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as ex:
+        return list(ex.map(fn, items))
+
+
+
+def paginate_iter(
+    path: str,
+    params: dict | None = None,
+    page_key: str = "results",
+    chunk_size: int = 1000
+) -> T.Iterator[list[dict]]:
     """
     Cursor pagination helper for endpoints that return: {"results":[...], "paging":{"next":{"after":"..."}}}
     Many CRM list endpoints follow this pattern. [3](https://developers.hubspot.com/docs/guides/crm/using-object-apis)
+    Yields records in chunks of ~chunk_size; the next page is already requested in the
+    background while the caller processes (e.g. writes) the current chunk.
     """
-    out = []
     p = dict(params or {})
-    while True:
-        data = hs_request("GET", path, params=p)
-        out.extend(data.get(page_key, []))
-        after = (((data.get("paging") or {}).get("next") or {}).get("after"))
-        if not after:
-            break
-        p["after"] = after
-    return out
+    buf = []
+    with ThreadPoolExecutor(max_workers=1) as ex:
+        pending = ex.submit(hs_request, "GET", path, params=dict(p))
+        while pending is not None:
+            data = pending.result()
+            after = (((data.get("paging") or {}).get("next") or {}).get("after"))
+            pending = None
+            if after:
+                p["after"] = after
+                pending = ex.submit(hs_request, "GET", path, params=dict(p))
+            buf.extend(data.get(page_key, []))
+            if len(buf) >= chunk_size:
+                yield buf
+                buf = []
+    if buf:
+        yield buf
+
+def paginate_get(path: str, params: dict | None = None, page_key: str = "results") -> list[dict]:
+    """
+    Collect every page from paginate_iter into one list (for small endpoints / callers needing all rows).
+    """
+    return [r for chunk in paginate_iter(path, params, page_key) for r in chunk]
+
 
 
+# Coalesce small appends into right-sized files on every bronze write
+BRONZE_TABLE_PROPERTIES = {
+    "delta.autoOptimize.optimizeWrite": "true",
+    "delta.autoOptimize.autoCompact": "true",
+}
+# Split large checkpoints into multiple Parquet parts (actions per part) so they are written/read in parallel
+spark.conf.set("spark.databricks.delta.checkpoint.partSize", "1048576")
+# New bronze tables get these as delta.* writer options on their creating write; existing
+# tables are altered once per run (paths already checked this run)
+_PROPS_CHECKED: set[str] = set()
 
-def write_bronze_delta(records: list[dict], entity: str, mode: str = "append") -> None:
+def ensure_table_properties(target_path: str, properties: dict[str, str]) -> None:
     """
-    Write raw records to Delta as-is with an ingestion timestamp.
+    Set Delta table properties on target_path if any are missing or different.
+    Checked at most once per path per run to avoid an extra commit on every write.
     """
-    if not records:
-        print(f"[{entity}] No records to write.")
+    if target_path in _PROPS_CHECKED:
         return
+    current = DeltaTable.forPath(spark, target_path).detail().first()["properties"] or {}
+    missing = {k: v for k, v in properties.items() if current.get(k) != v}
+    if missing:
+        props_sql = ", ".join(f"'{k}' = '{v}'" for k, v in missing.items())
+        spark.sql(f"ALTER TABLE delta.`{target_path}` SET TBLPROPERTIES ({props_sql})")
+    _PROPS_CHECKED.add(target_path)
 
-    ingest_ts = datetime.now(timezone.utc).isoformat()
+# Columns write_bronze_delta adds on top of the HubSpot payload
+BRONZE_METADATA_COLS = ("_ingested_at", "_entity")
 
-    rdd = sc.parallelize([json.dumps(r) for r in records])
-    df = spark.read.json(rdd)
+# Entity schemas as persisted under SCHEMA_CACHE_PATH (see get_entity_schema)
+_ENTITY_SCHEMAS: dict[str, Tz.StructType | None] = {}
 
-    df = (
-        df
-        .withColumn("_ingested_at", F.lit(ingest_ts))
-        .withColumn("_entity", F.lit(entity))
-    )
+def _widen_schema(base: Tz.DataType, extra: Tz.DataType) -> Tz.DataType:
+    """
+    Add fields of extra that base lacks, recursing through nested structs and arrays of structs.
+    Existing fields keep base's type (Delta cannot change a column type in place).
+    """
+    if isinstance(base, Tz.ArrayType) and isinstance(extra, Tz.ArrayType):
+        return Tz.ArrayType(_widen_schema(base.elementType, extra.elementType), base.containsNull)
+    if not (isinstance(base, Tz.StructType) and isinstance(extra, Tz.StructType)):
+        return base
+    extra_by_name = {f.name: f for f in extra.fields}
+    fields = []
+    for f in base.fields:
+        e = extra_by_name.get(f.name)
+        if e:
+            f = Tz.StructField(f.name, _widen_schema(f.dataType, e.dataType), f.nullable)
+        fields.append(f)
+    known = set(base.fieldNames())
+    fields.extend(e for e in extra.fields if e.name not in known)
+    return Tz.StructType(fields)
+
+def _has_unknown_keys(value: T.Any, data_type: Tz.DataType) -> bool:
+    """
+    True if value (a record or any nested object / list of objects in it) has a key the
+    matching struct in data_type doesn't cover. Map and string columns accept any keys.
+    """
+    if isinstance(value, dict):
+        if not isinstance(data_type, Tz.StructType):
+            return False
+        fields = {f.name: f.dataType for f in data_type.fields}
+        return any(k not in fields or _has_unknown_keys(v, fields[k]) for k, v in value.items())
+    if isinstance(value, list) and isinstance(data_type, Tz.ArrayType):
+        return any(_has_unknown_keys(v, data_type.elementType) for v in value)
+    return False
+
+def get_entity_schema(entity: str, target_path: str) -> Tz.StructType | None:
+    """
+    Return the known bronze schema for entity: the existing Delta table's schema (minus
+    BRONZE_METADATA_COLS) widened with the persisted schema, or None before the first ingest.
+    """
+    if entity not in _ENTITY_SCHEMAS:
+        try:
+            schema_json = dbutils.fs.head(f"{SCHEMA_CACHE_PATH}/{entity}.json", 10 * 1024 * 1024)
+            _ENTITY_SCHEMAS[entity] = Tz.StructType.fromJson(json.loads(schema_json))
+        except Exception:
+            _ENTITY_SCHEMAS[entity] = None
+    persisted = _ENTITY_SCHEMAS[entity]
+
+    table_schema = None
+    if DeltaTable.isDeltaTable(spark, target_path):
+        table_schema = Tz.StructType([
+            f for f in DeltaTable.forPath(spark, target_path).toDF().schema.fields
+            if f.name not in BRONZE_METADATA_COLS
+        ])
+    if table_schema is not None and persisted is not None:
+        return _widen_schema(table_schema, persisted)
+    return table_schema or persisted
+
+def save_entity_schema(entity: str, schema: Tz.StructType) -> None:
+    dbutils.fs.put(f"{SCHEMA_CACHE_PATH}/{entity}.json", schema.json(), overwrite=True)
+    _ENTITY_SCHEMAS[entity] = schema
+
+def _bronze_df(records: list[dict], entity: str, schema: Tz.StructType | None):
+    # Build the frame from JSON strings via spark.createDataFrame + from_json rather than
+    # sc.parallelize + spark.read.json, so it also runs on shared / Spark Connect clusters where sc
+    # and RDDs are unavailable (classic clusters still parallelize the local list).
+    # The inference pass (schema_of_json_agg, DBR 13.2+) only runs when there is no known schema
+    # or a record carries a key (at any depth) outside it; the known schema is then widened.
+    # A value whose type no longer fits its column (e.g. 1234.5 in a bigint field) can't be
+    # widened into Delta, so parsing is FAILFAST: the write errors instead of storing a null.
+    # Returns the frame and the (possibly widened) schema.
+    raw = spark.createDataFrame([(_json_dumps(r),) for r in records], "value string")
+    if schema is None or any(_has_unknown_keys(r, schema) for r in records):
+        inferred_ddl = raw.select(F.expr("schema_of_json_agg(value)")).first()[0]
+        inferred = raw.select(F.from_json("value", inferred_ddl).alias("r")).select("r.*").schema
+        schema = inferred if schema is None else _widen_schema(schema, inferred)
+    df = raw.select(F.from_json("value", schema, {"mode": "FAILFAST"}).alias("r")).select("r.*")
+
+    return df.select("*", F.lit(RUN_TS).alias("_ingested_at"), F.lit(entity).alias("_entity")), schema
+
+def _publish_bronze(df, target_path: str, mode: str, merge_key: str) -> None:
+    # One Delta commit on the bronze table: a single MERGE, or a single overwrite/append
+    if mode in ("merge", "upsert") and DeltaTable.isDeltaTable(spark, target_path):
+        # MERGE rejects several source rows per target row (a record edited mid-pagination
+        # can be returned twice), so keep one per key
+        merge = (
+            DeltaTable.forPath(spark, target_path).alias("t")
+            .merge(df.dropDuplicates([merge_key]).alias("s"), f"t.`{merge_key}` = s.`{merge_key}`")
+            .withSchemaEvolution()  # like mergeSchema for plain writes (DBR 15.2+ / Delta 3.2+)
+            .whenMatchedUpdateAll()
+            .whenNotMatchedInsertAll()
+        )
+        if mode == "merge":
+            merge = merge.whenNotMatchedBySourceDelete()
+        merge.execute()
+    else:
+        (
+            df.write.format("delta")
+            .mode("overwrite" if mode in ("merge", "upsert") else mode)
+            .option("mergeSchema", "true")
+            .options(**BRONZE_TABLE_PROPERTIES)  # applied as table properties when this write creates the table
+            .save(target_path)
+        )
 
+def write_bronze_delta(
+    records: list[dict] | T.Iterable[list[dict]],
+    entity: str,
+    mode: str = "append",
+    merge_key: str = "id"
+) -> None:
+    """
+    Write raw records to Delta as-is, stamped with the run's ingestion timestamp (RUN_TS).
+    records is either one list of records or an iterable of record chunks (see paginate_iter).
+    Chunks are appended to a per-entity staging Delta path as they arrive, so the driver holds one
+    chunk at a time, and then published to the bronze table in a single commit; a failure
+    mid-stream leaves the bronze table untouched. The price is that streamed data is written
+    twice (staging, then bronze); pass a list when it fits in driver memory to write once.
+    mode="merge" upserts on merge_key and deletes rows the source no longer returns
+    (full refresh as a MERGE); mode="upsert" only updates/inserts on merge_key (incremental
+    loads into a table that also takes full loads, so ids never duplicate). Both fall back to
+    overwrite for the first write to a new path. Other modes are passed straight to the DataFrameWriter.
+    """
     target_path = f"{BRONZE_BASE_PATH}/{entity}"
-    (
-        df.write.format("delta")
-        .mode(mode)
-        .option("mergeSchema", "true")
-        .save(target_path)
-    )
+    staging_path = None
+    schema = get_entity_schema(entity, target_path)
+
+    if isinstance(records, list):
+        total = len(records)
+        df = None
+        if records:
+            df, schema = _bronze_df(records, entity, schema)
+    else:
+        staging_path = f"{BRONZE_BASE_PATH}/_staging/{entity}"
+        total = 0
+        for chunk in records:
+            if not chunk:
+                continue
+            chunk_df, schema = _bronze_df(chunk, entity, schema)
+            writer = (
+                chunk_df.write.format("delta")
+                .mode("overwrite" if total == 0 else "append")
+                # first chunk replaces anything left behind by a failed run
+                .option("overwriteSchema" if total == 0 else "mergeSchema", "true")
+            )
+            if total == 0:
+                # Throwaway table: skip optimized-write shuffles and auto-compaction on every chunk
+                writer = writer.options(**{
+                    "delta.autoOptimize.optimizeWrite": "false",
+                    "delta.autoOptimize.autoCompact": "false",
+                })
+            writer.save(staging_path)
+            total += len(chunk)
+        df = spark.read.format("delta").load(staging_path) if total else None
+
+    if df is None:
+        print(f"[{entity}] No records to write.")
+        return
+
+    _publish_bronze(df, target_path, mode, merge_key)
+    ensure_table_properties(target_path, BRONZE_TABLE_PROPERTIES)
+    # Persist only after the bronze write succeeded
+    if schema != _ENTITY_SCHEMAS.get(entity):
+        save_entity_schema(entity, schema)
+    if staging_path:
+        dbutils.fs.rm(staging_path, True)
 
     # Optional UC registration
     if CATALOG and SCHEMA:
@@ -162,7 +542,7 @@ def write_bronze_delta(records: list[dict], entity: str, mode: str = "append") -
             USING DELTA
             LOCATION '{target_path}'
         """)
-    print(f"[{entity}] Wrote {df.count()} rows to {target_path}")
+    print(f"[{entity}] Wrote {total} rows to {target_path}")
 
 
 
@@ -170,41 +550,70 @@ def write_bronze_delta(records: list[dict], entity: str, mode: str = "append") -
 watermark_schema = Tz.StructType([
     Tz.StructField("entity", Tz.StringType(), False),
     Tz.StructField("watermark_type", Tz.StringType(), False),  # e.g. hs_lastmodifieddate
-    Tz.StructField("watermark_value", Tz.StringType(), True),  # store as ISO string or ms string
+    Tz.StructField("watermark_value", Tz.StringType(), True),  # epoch ms string (legacy rows may hold ISO)
     Tz.StructField("updated_at", Tz.TimestampType(), True),
 ])
 
+def to_epoch_ms(value: str) -> int:
+    """
+    Normalize a watermark (epoch ms string or ISO-8601 timestamp) to epoch milliseconds.
+    Naive ISO timestamps are treated as UTC.
+    """
+    if value.isdigit():
+        return int(value)
+    dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1000)
+
 def ensure_watermark_table():
     if not any(f.path.rstrip("/") == WATERMARK_PATH for f in dbutils.fs.ls(WATERMARK_PATH.rsplit("/", 1)[0])):
         pass  # parent exists
     # Create if missing
-    try:
-        spark.read.format("delta").load(WATERMARK_PATH).limit(1).collect()
-    except Exception:
+    if not DeltaTable.isDeltaTable(spark, WATERMARK_PATH):
         empty = spark.createDataFrame([], watermark_schema)
         empty.write.format("delta").mode("overwrite").save(WATERMARK_PATH)
 
 ensure_watermark_table()
 
+# The watermark table is rewritten by small MERGEs, so size its files for rewrites
+WATERMARK_TABLE_PROPERTIES = {
+    **BRONZE_TABLE_PROPERTIES,
+    "delta.tuneFileSizesForRewrites": "true",
+}
+ensure_table_properties(WATERMARK_PATH, WATERMARK_TABLE_PROPERTIES)
+
+# Watermark DeltaTable handle, opened once per run (see _watermark_table)
+_WM_TABLE: DeltaTable | None = None
+
+def _watermark_table() -> DeltaTable:
+    global _WM_TABLE
+    if _WM_TABLE is None:
+        _WM_TABLE = DeltaTable.forPath(spark, WATERMARK_PATH)
+    return _WM_TABLE
+
 def get_watermark(entity: str, default_iso: str = "1970-01-01T00:00:00.000Z") -> str:
-    df = spark.read.format("delta").load(WATERMARK_PATH)
+    df = _watermark_table().toDF()
+    # Single aggregation (no sort): latest value by updated_at, null when the entity has no row
     row = (
         df.filter(F.col("entity") == entity)
-          .orderBy(F.col("updated_at").desc_nulls_last())
-          .limit(1)
-          .collect()
+          .agg(F.max_by("watermark_value", "updated_at").alias("wm"))
+          .collect()[0]
     )
-    return row[0]["watermark_value"] if row else default_iso
+    return row["wm"] or default_iso
 
 def set_watermark(entity: str, watermark_type: str, watermark_value: str) -> None:
     now_ts = datetime.now(timezone.utc)
-    df = spark.read.format("delta").load(WATERMARK_PATH)
     new_row = spark.createDataFrame([(entity, watermark_type, watermark_value, now_ts)], watermark_schema)
 
-    # Simple overwrite-by-entity approach (small control table)
-    remaining = df.filter(F.col("entity") != entity)
-    out = remaining.unionByName(new_row)
-    out.write.format("delta").mode("overwrite").save(WATERMARK_PATH)
+    # Upsert this entity's row in a single commit (no full-table rewrite)
+    (
+        _watermark_table().alias("t")
+        .merge(new_row.alias("s"), "t.entity = s.entity")
+        .whenMatchedUpdateAll()
+        .whenNotMatchedInsertAll()
+        .execute()
+    )
 
 
 
@@ -19,38 +19,40 @@ def load_owners():
         # owners/v2/owners returns list directly; normalize:
         if isinstance(data, dict):
             data = [data]
-    write_bronze_delta(data, "crm_owners", mode="overwrite")
+    write_bronze_delta(data, "crm_owners", mode="merge")
 
 def load_crm_object(object_name: str, entity: str):
     # List records. [3](https://developers.hubspot.com/docs/guides/crm/using-object-apis)
-    rows = paginate_get(f"/crm/v3/objects/{object_name}", params={"limit": 100, "archived": "false"})
-    write_bronze_delta(rows, entity, mode="overwrite")
+    # Streamed in chunks: large objects (e.g. feedback_submissions backfills) are written as pages arrive.
+    chunks = paginate_iter(f"/crm/v3/objects/{object_name}", params={"limit": 100, "archived": "false"})
+    write_bronze_delta(chunks, entity, mode="merge")
 
 def load_meeting_links():
     # List meeting scheduling pages. [16](https://developers.hubspot.com/docs/api-reference/library-meetings-v3/guide)
-    rows = paginate_get("/scheduler/v3/meetings/meeting-links", params={"limit": 100})
-    write_bronze_delta(rows, "scheduler_meeting_links", mode="overwrite")
+    chunks = paginate_iter("/scheduler/v3/meetings/meeting-links", params={"limit": 100})
+    write_bronze_delta(chunks, "scheduler_meeting_links", mode="merge")
 
 def load_campaigns():
     # Campaigns API. [12](https://developers.hubspot.com/docs/api-reference/marketing-campaigns-public-api-v3/guide)
     rows = paginate_get("/marketing/v3/campaigns", params={"limit": 100})
-    write_bronze_delta(rows, "marketing_campaigns", mode="overwrite")
+    write_bronze_delta(rows, "marketing_campaigns", mode="merge")
     return rows
 
-def load_campaign_revenue(campaigns: list[dict]):
+def _safe_revenue(guid: str) -> dict | None:
     # Revenue report endpoint exists per docs. [13](https://developers.hubspot.com/docs/api-reference/marketing-campaigns-public-api-v3/campaign-reporting/get-marketing-v3-campaigns-campaignGuid-reports-revenue)
-    out = []
-    for c in campaigns:
-        guid = c.get("id")
-        if not guid:
-            continue
-        try:
-            rev = hs_request("GET", f"/marketing/v3/campaigns/{guid}/reports/revenue", params={})
-            rev["_campaignGuid"] = guid
-            out.append(rev)
-        except Exception as e:
-            print(f"Revenue fetch failed for campaign {guid}: {e}")
-    write_bronze_delta(out, "marketing_campaign_revenue", mode="overwrite")
+    try:
+        rev = hs_request("GET", f"/marketing/v3/campaigns/{guid}/reports/revenue", params={})
+        rev["_campaignGuid"] = guid
+        return rev
+    except Exception as e:
+        print(f"Revenue fetch failed for campaign {guid}: {e}")
+        return None
+
+def load_campaign_revenue(campaigns: list[dict]):
+    # Independent GETs per campaign: fan out over the shared session, drop failed fetches.
+    guids = [c["id"] for c in campaigns if c.get("id")]
+    out = [rev for rev in map_concurrent(_safe_revenue, guids) if rev is not None]
+    write_bronze_delta(out, "marketing_campaign_revenue", mode="merge", merge_key="_campaignGuid")
 
 def load_currencies():
     # settings.currencies.read scope provides currency/exchange rate reads. [7](https://developers.hubspot.com/docs/apps/developer-platform/build-apps/authentication/scopes)
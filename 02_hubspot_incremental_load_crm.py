@@ -5,24 +5,25 @@
 
 # 02_hubspot_incremental_load_crm
 
-def crm_search_since(object_name: str, since_iso: str, properties: list[str] | None = None, limit: int = 100) -> list[dict]:
+def crm_search_since(object_name: str, since: str, properties: list[str] | None = None, limit: int = 100) -> list[dict]:
     """
     Uses CRM Search API to pull records with hs_lastmodifieddate >= since.
+    `since` may be an epoch ms string or ISO timestamp; it is sent to HubSpot as epoch ms.
     Search API docs: /crm/v3/objects/{object}/search. [4](https://developers.hubspot.com/docs/api-reference/search/guide)
     Community guidance: hs_lastmodifieddate can be used for incremental polling. [18](https://community.hubspot.com/t5/APIs-Integrations/How-to-use-crm-v3-objects-deals-or-another-api-to-get-the-deals/m-p/358609)
     """
     after = None
     out = []
 
-    # HubSpot expects ms timestamps for numeric comparisons in many places;
-    # we'll send ISO if supported, otherwise convert to ms in your environment if needed.
+    # Datetime properties are compared server-side as epoch ms
+    since_ms = str(to_epoch_ms(since))
     while True:
         body = {
             "filterGroups": [{
                 "filters": [{
                     "propertyName": "hs_lastmodifieddate",
                     "operator": "GTE",
-                    "value": since_iso
+                    "value": since_ms
                 }]
             }],
             "sorts": ["hs_lastmodifieddate"],
@@ -45,22 +46,25 @@ def crm_search_since(object_name: str, since_iso: str, properties: list[str] | N
 
 def incremental_object(object_name: str, entity: str):
     since = get_watermark(entity)
-    rows = crm_search_since(object_name, since_iso=since, properties=None, limit=100)
+    rows = crm_search_since(object_name, since=since, properties=None, limit=100)
 
-    write_bronze_delta(rows, entity, mode="append")
+    # Upsert on id: the GTE watermark re-reads the boundary record every run, and the full load
+    # MERGEs into this same table, so appending would pile up duplicate ids
+    write_bronze_delta(rows, entity, mode="upsert")
 
     # Update watermark to max hs_lastmodifieddate found
     if rows:
-        max_wm = None
-        for r in rows:
-            # hs_lastmodifieddate is a property on returned objects
-            props = r.get("properties") or {}
-            v = props.get("hs_lastmodifieddate")
-            if v and (max_wm is None or v > max_wm):
-                max_wm = v
+        # hs_lastmodifieddate is a property on returned objects; compare as epoch ms because
+        # ISO strings with and without milliseconds don't sort chronologically
+        max_wm = max(
+            (v for r in rows if (v := (r.get("properties") or {}).get("hs_lastmodifieddate"))),
+            key=to_epoch_ms,
+            default=None,
+        )
         if max_wm:
-            set_watermark(entity, "hs_lastmodifieddate", max_wm)
-            print(f"[{entity}] watermark -> {max_wm}")
+            max_wm_ms = str(to_epoch_ms(max_wm))
+            set_watermark(entity, "hs_lastmodifieddate", max_wm_ms)
+            print(f"[{entity}] watermark -> {max_wm} ({max_wm_ms} ms)")
     else:
         print(f"[{entity}] no new/updated rows since {since}")
 
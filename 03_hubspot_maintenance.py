@@ -0,0 +1,34 @@
+# Databricks notebook source
+# MAGIC %run "./00_hubspot_config_and_scopes"
+
+# COMMAND ----------
+
+# 03_hubspot_maintenance
+# ===========================================
+# Schedule as a weekly job (separate from the loads): compacts small files left by
+# incremental appends / MERGEs and removes files older than the retention window.
+
+VACUUM_RETAIN_HOURS = 168  # 7 days, Delta's default minimum retention
+
+def maintain_delta_table(target_path: str, zorder_col: str | None = "id") -> None:
+    if not DeltaTable.isDeltaTable(spark, target_path):
+        print(f"[maintenance] skip {target_path} (no Delta table yet)")
+        return
+
+    table = f"delta.`{target_path}`"
+    columns = DeltaTable.forPath(spark, target_path).toDF().columns
+    if zorder_col and zorder_col in columns:
+        spark.sql(f"OPTIMIZE {table} ZORDER BY (`{zorder_col}`)")
+    else:
+        spark.sql(f"OPTIMIZE {table}")
+    spark.sql(f"VACUUM {table} RETAIN {VACUUM_RETAIN_HOURS} HOURS")
+    print(f"[maintenance] optimized + vacuumed {target_path}")
+
+
+for src in SOURCES:
+    maintain_delta_table(f"{BRONZE_BASE_PATH}/{src['entity']}")
+
+# Watermark control table: tiny, no Z-order needed
+maintain_delta_table(WATERMARK_PATH, zorder_col=None)
+
+print("Maintenance complete.")